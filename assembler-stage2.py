@@ -12,8 +12,37 @@
 """
 
 import argparse
+import struct
 import sys
-from typing import List, Dict, Tuple
+from array import array
+from typing import List, Dict, Optional, Tuple
+
+from uvm_asm import tokenize
+
+# Максимальный размер инструкции в байтах (STORE: опкод, регистр, адрес)
+_MAX_INSTRUCTION_SIZE = 4
+
+# Операнды STORE: номер регистра и 16-битный адрес (little-endian)
+_REG_ADDR16 = struct.Struct('<BH')
+
+# Готовые строковые представления байтов для форматированного вывода
+_HEX0X = tuple(f'0x{i:02x}' for i in range(256))
+_DEC = tuple(str(i) for i in range(256))
+
+# Значения однобайтовых hex-литералов: '0x0a', '0x0A', '0X0A' -> 10
+_HEX_LUT = {
+    fmt.format(i): i
+    for fmt in ('0x{:02x}', '0x{:02X}', '0X{:02X}')
+    for i in range(256)
+}
+
+
+def _case_insensitive(table: Dict) -> Dict:
+    """Дополняет таблицу ключами в нижнем регистре"""
+    result = dict(table)
+    for key, value in table.items():
+        result[key.lower()] = value
+    return result
 
 
 class Assembler:
@@ -48,25 +77,60 @@ class Assembler:
             'D': 0x03,
         }
         
-        # Внутреннее представление (из Этапа 1)
-        self.instructions = []
+        # Написание в исходном тексте -> каноническое имя / код регистра
+        self._command_names = _case_insensitive({name: name for name in self.commands})
+        self._register_codes = _case_insensitive(self.registers)
+        
+        # Мнемоника по опкоду (для таблицы инструкций): индекс - опкод
+        self._mnem_by_op = [''] * (max(self.commands.values()) + 1)
+        for name, opcode in self.commands.items():
+            self._mnem_by_op[opcode] = name
+        
+        # Внутреннее представление: параллельные массивы по инструкциям
+        self._addrs = array('I')
+        self._opcodes = array('B')
+        self._lines = array('I')
         self.labels = {}
+        # Машинный код, накапливаемый при генерации
+        self._machine_code: bytearray = bytearray()
+        # Ссылки вперёд: (индекс инструкции, имя метки, номер строки)
+        self._fixups: List[Tuple[int, str, int]] = []
         self.errors = []
-        self.source_lines = []
+        self.source_text = ''
+        
+        # Таблица обработчиков операндов по мнемонике
+        self._handlers = {
+            'HALT':  self._h_noop,
+            'RET':   self._h_noop,
+            'PUSH':  self._h_reg,
+            'POP':   self._h_reg,
+            'JMP':   self._h_addr,
+            'JZ':    self._h_addr,
+            'JNZ':   self._h_addr,
+            'CALL':  self._h_addr,
+            'CMP':   self._h_rr,
+            'ADD':   self._h_ri,
+            'SUB':   self._h_ri,
+            'MUL':   self._h_ri,
+            'DIV':   self._h_ri,
+            'MOD':   self._h_ri,
+            'LOAD':  self._h_load,
+            'STORE': self._h_store,
+        }
     
     def assemble(self, input_file: str):
         """Главный метод ассемблирования"""
         try:
             with open(input_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+                text = f.read()
             
-            self.source_lines = lines
+            self.source_text = text
             
-            # Первый проход: поиск меток
-            self._first_pass(lines)
+            # Один проход: метки и генерация кода
+            self._single_pass(text)
             
-            # Второй проход: генерация кода
-            self._second_pass(lines)
+            # Подстановка адресов меток, использованных до определения
+            self._resolve_fixups()
             
             if self.errors:
                 print("❌ ОШИБКИ АССЕМБЛИРОВАНИЯ:")
@@ -78,240 +142,268 @@ class Assembler:
             print(f"❌ Ошибка: файл '{input_file}' не найден")
             sys.exit(1)
     
-    def _first_pass(self, lines: List[str]):
-        """Первый проход: поиск меток"""
+    @property
+    def source_lines(self) -> List[str]:
+        """Строки исходного текста (разбиваются только по запросу)"""
+        return self.source_text.splitlines(keepends=True)
+    
+    def _single_pass(self, text: str):
+        """Единственный проход: сбор меток и генерация машинного кода"""
         address = 0
         
-        for line_num, line in enumerate(lines, 1):
-            # Убрать комментарии
-            if ';' in line:
-                line = line[:line.index(';')]
-            
-            line = line.strip()
-            
-            if not line:
-                continue
-            
-            # Поиск метки
-            if ':' in line:
-                label_name = line.split(':')[0].strip()
-                self.labels[label_name] = address
-                continue
-            
-            # Подсчёт адреса
-            parts = line.split()
-            if parts:
-                command = parts[0].upper()
-                if command in self.commands:
-                    # Количество байтов для команды
-                    if command == 'HALT' or command == 'RET':
-                        address += 1
-                    elif command in ['PUSH', 'POP']:
-                        address += 2
-                    else:
-                        address += 3
-    
-    def _second_pass(self, lines: List[str]):
-        """Второй проход: генерация машинного кода"""
-        address = 0
+        # Буфер с запасом: не больше одной инструкции на строку
+        code = bytearray((text.count('\n') + 1) * _MAX_INSTRUCTION_SIZE)
+        self._machine_code = code
         
-        for line_num, line in enumerate(lines, 1):
-            # Убрать комментарии
-            if ';' in line:
-                line = line[:line.index(';')]
-            
-            line = line.strip()
-            
-            if not line:
-                continue
-            
-            # Пропустить метки
-            if ':' in line:
-                continue
-
-            # Убрать комментарии
-            if ';' in line:
-                line = line[:line.index(';')]
-
-            # ✅ ДОБАВИТЬ ЭТУ СТРОКУ:
-            line = line.replace(',', ' ')
-
-            line = line.strip()
-
-            # Парсинг команды
-            parts = line.split()
-            if not parts:
+        # Локальные ссылки вместо поиска атрибутов на каждой инструкции
+        commands = self.commands
+        command_names = self._command_names
+        handlers = self._handlers
+        labels = self.labels
+        add_addr = self._addrs.append
+        add_opcode = self._opcodes.append
+        add_line = self._lines.append
+        
+        for line_num, label_name, parts in tokenize(text):
+            # Метка указывает на текущий адрес
+            if label_name is not None:
+                labels[label_name] = address
                 continue
             
-            command = parts[0].upper()
-            
-            if command not in self.commands:
-                self.errors.append(f"Строка {line_num}: Неизвестная команда '{command}'")
+            # Команда и до двух операндов; иначе строка не подошла под синтаксис
+            count = len(parts) if parts is not None else 0
+            if count == 3:
+                mnemonic, op1, op2 = parts
+            elif count == 2:
+                mnemonic, op1 = parts
+                op2 = None
+            elif count == 1:
+                mnemonic = parts[0]
+                op1 = op2 = None
+            else:
+                self.errors.append(f"Строка {line_num}: Синтаксическая ошибка")
                 continue
             
-            # Создать инструкцию
-            opcode = self.commands[command]
-            operands = []
+            # Мнемоника в верхнем или нижнем регистре находится без upper()
+            command = command_names.get(mnemonic)
+            if command is None:
+                command = command_names.get(mnemonic.upper())
+                if command is None:
+                    self.errors.append(f"Строка {line_num}: Неизвестная команда '{mnemonic.upper()}'")
+                    continue
+            opcode = commands[command]
             
             try:
-                # Парсинг операндов в зависимости от команды
-                if command == 'HALT' or command == 'RET':
-                    # Без операндов
-                    pass
+                # Парсинг операндов обработчиком команды
+                operands = handlers[command](command, op1, op2, line_num)
+                if operands is None:
+                    continue
                 
-                elif command in ['PUSH', 'POP']:
-                    # Один операнд (регистр)
-                    reg = parts[1].upper() if len(parts) > 1 else None
-                    if not reg or reg not in self.registers:
-                        self.errors.append(f"Строка {line_num}: Неверный регистр '{reg}'")
-                        continue
-                    operands = [self.registers[reg]]
-                
-                elif command in ['JMP', 'JZ', 'JNZ', 'CALL']:
-                    # Один операнд (метка или адрес)
-                    label = parts[1] if len(parts) > 1 else None
-                    if not label:
-                        self.errors.append(f"Строка {line_num}: Не указана метка для {command}")
-                        continue
-                    
-                    if label in self.labels:
-                        addr = self.labels[label]
-                    elif label.isdigit():
-                        addr = int(label)
-                    else:
-                        self.errors.append(f"Строка {line_num}: Неизвестная метка '{label}'")
-                        continue
-                    
-                    operands = [addr]
-                
-                elif command == 'CMP':
-                    # Два операнда (два регистра)
-                    if len(parts) < 3:
-                        self.errors.append(f"Строка {line_num}: CMP требует двух регистров")
-                        continue
-                    
-                    reg1 = parts[1].upper()
-                    reg2 = parts[2].upper()
-                    
-                    if reg1 not in self.registers or reg2 not in self.registers:
-                        self.errors.append(f"Строка {line_num}: Неверные регистры для CMP")
-                        continue
-                    
-                    operands = [self.registers[reg1], self.registers[reg2]]
-
-                elif command in ['ADD', 'SUB', 'MUL', 'DIV', 'MOD']:
-                    if len(parts) < 3:
-                        self.errors.append(f"Строка {line_num}: {command} требует двух операндов")
-                        continue
-
-                    reg1 = parts[1].upper()
-                    op2_str = parts[2]
-
-                    if reg1 not in self.registers:
-                        self.errors.append(f"Строка {line_num}: Неверный регистр '{reg1}' для {command}")
-                        continue
-
-                    # второй операнд: либо регистр, либо число
-                    if op2_str.upper() in self.registers:
-                        op2 = self.registers[op2_str.upper()]
-                    elif op2_str.startswith('0x'):
-                        op2 = int(op2_str, 16)
-                    else:
-                        op2 = int(op2_str)
-
-                    if not (0 <= op2 <= 255):
-                        self.errors.append(f"Строка {line_num}: Операнд вне диапазона [0-255] для {command}")
-                        continue
-
-                    operands = [self.registers[reg1], op2]
-
-                elif command == 'LOAD':
-                    # Два операнда (регистр, значение или регистр)
-                    if len(parts) < 3:
-                        self.errors.append(f"Строка {line_num}: LOAD требует двух операндов")
-                        continue
-                    
-                    reg = parts[1].upper()
-                    value_str = parts[2]
-                    
-                    if reg not in self.registers:
-                        self.errors.append(f"Строка {line_num}: Неверный регистр '{reg}'")
-                        continue
-                    
-                    # Парсинг значения
-                    if value_str.upper() in self.registers:
-                        value = self.registers[value_str.upper()]
-                    elif value_str.startswith('0x'):
-                        value = int(value_str, 16)
-                    else:
-                        value = int(value_str)
-                    
-                    if not (0 <= value <= 255):
-                        self.errors.append(f"Строка {line_num}: Значение вне диапазона [0-255]")
-                        continue
-                    
-                    operands = [self.registers[reg], value]
-                
-                elif command == 'STORE':
-                    # Два операнда (регистр, адрес)
-                    if len(parts) < 3:
-                        self.errors.append(f"Строка {line_num}: STORE требует двух операндов")
-                        continue
-                    
-                    reg = parts[1].upper()
-                    addr_str = parts[2]
-                    
-                    if reg not in self.registers:
-                        self.errors.append(f"Строка {line_num}: Неверный регистр '{reg}'")
-                        continue
-                    
-                    # Парсинг адреса
-                    if addr_str.startswith('0x'):
-                        addr = int(addr_str, 16)
-                    else:
-                        addr = int(addr_str)
-                    
-                    if not (0 <= addr <= 65535):
-                        self.errors.append(f"Строка {line_num}: Адрес вне диапазона")
-                        continue
-                    
-                    operands = [self.registers[reg], addr & 0xFF, (addr >> 8) & 0xFF]
-                
-                # Добавить инструкцию
-                self.instructions.append({
-                    'mnemonic': command,
-                    'opcode': opcode,
-                    'operands': operands,
-                    'line': line_num,
-                    'address': address
-                })
+                # Записать инструкцию в буфер по текущему адресу
+                end = address + 1 + len(operands)
+                code[address] = opcode
+                code[address + 1:end] = operands
+                add_addr(address)
+                add_opcode(opcode)
+                add_line(line_num)
                 
                 # Обновить адрес
-                address += 1 + len(operands)
+                address = end
             
             except (ValueError, IndexError) as e:
                 self.errors.append(f"Строка {line_num}: Ошибка парсинга: {e}")
+        
+        # Отбросить неиспользованный запас буфера
+        del code[address:]
     
-    # ========== НОВЫЕ МЕТОДЫ ДЛЯ ЭТАПА 2 ==========
+    def _parse_int(self, text: str) -> int:
+        """Числовой операнд: hex с префиксом 0x либо десятичное число"""
+        value = _HEX_LUT.get(text)
+        if value is not None:
+            return value
+        if text.startswith(('0x', '0X')):
+            return int(text, 16)
+        return int(text)
+    
+    # ========== ОБРАБОТЧИКИ ОПЕРАНДОВ ==========
+    # Каждый обработчик возвращает список операндов или None,
+    # если ошибка уже записана в self.errors.
+    
+    def _h_noop(self, command: str, op1: Optional[str], op2: Optional[str],
+                line_num: int) -> Optional[List[int]]:
+        """HALT, RET: без операндов"""
+        return []
     
-    def get_machine_code(self) -> List[int]:
+    def _h_reg(self, command: str, op1: Optional[str], op2: Optional[str],
+               line_num: int) -> Optional[List[int]]:
+        """PUSH, POP: один операнд (регистр)"""
+        reg = self._register_codes.get(op1)
+        if reg is None:
+            self.errors.append(f"Строка {line_num}: Неверный регистр '{op1.upper() if op1 else None}'")
+            return None
+        return [reg]
+    
+    def _h_addr(self, command: str, op1: Optional[str], op2: Optional[str],
+                line_num: int) -> Optional[List[int]]:
+        """JMP, JZ, JNZ, CALL: один операнд (метка или адрес)"""
+        label = op1
+        if not label:
+            self.errors.append(f"Строка {line_num}: Не указана метка для {command}")
+            return None
+        
+        # Обычный случай - уже известная метка: один поиск в словаре
+        addr = self.labels.get(label)
+        if addr is None:
+            if label.isdigit():
+                addr = int(label)
+            else:
+                # Метка ещё не определена: адрес подставим в конце
+                self._fixups.append((len(self._opcodes), label, line_num))
+                addr = 0
+        
+        # Адрес перехода занимает один байт
+        if addr > 255:
+            self.errors.append(f"Строка {line_num}: Адрес вне диапазона [0-255] для {command}")
+            return None
+        
+        return [addr]
+    
+    def _h_rr(self, command: str, op1: Optional[str], op2: Optional[str],
+              line_num: int) -> Optional[List[int]]:
+        """CMP: два операнда (два регистра)"""
+        if not op2:
+            self.errors.append(f"Строка {line_num}: CMP требует двух регистров")
+            return None
+        
+        reg1 = self._register_codes.get(op1)
+        reg2 = self._register_codes.get(op2)
+        
+        if reg1 is None or reg2 is None:
+            self.errors.append(f"Строка {line_num}: Неверные регистры для CMP")
+            return None
+        
+        return [reg1, reg2]
+    
+    def _h_ri(self, command: str, op1: Optional[str], op2: Optional[str],
+              line_num: int) -> Optional[List[int]]:
+        """ADD, SUB, MUL, DIV, MOD: регистр и регистр либо число"""
+        if not op2:
+            self.errors.append(f"Строка {line_num}: {command} требует двух операндов")
+            return None
+        
+        reg1 = self._register_codes.get(op1)
+        
+        if reg1 is None:
+            self.errors.append(f"Строка {line_num}: Неверный регистр '{op1.upper()}' для {command}")
+            return None
+        
+        # второй операнд: либо регистр, либо число
+        value = self._register_codes.get(op2)
+        if value is None:
+            value = self._parse_int(op2)
+        
+        if not (0 <= value <= 255):
+            self.errors.append(f"Строка {line_num}: Операнд вне диапазона [0-255] для {command}")
+            return None
+        
+        return [reg1, value]
+    
+    def _h_load(self, command: str, op1: Optional[str], op2: Optional[str],
+                line_num: int) -> Optional[List[int]]:
+        """LOAD: регистр и значение либо регистр"""
+        if not op2:
+            self.errors.append(f"Строка {line_num}: LOAD требует двух операндов")
+            return None
+        
+        reg = self._register_codes.get(op1)
+        
+        if reg is None:
+            self.errors.append(f"Строка {line_num}: Неверный регистр '{op1.upper()}'")
+            return None
+        
+        # Парсинг значения
+        value = self._register_codes.get(op2)
+        if value is None:
+            value = self._parse_int(op2)
+        
+        if not (0 <= value <= 255):
+            self.errors.append(f"Строка {line_num}: Значение вне диапазона [0-255]")
+            return None
+        
+        return [reg, value]
+    
+    def _h_store(self, command: str, op1: Optional[str], op2: Optional[str],
+                 line_num: int) -> Optional[bytes]:
+        """STORE: регистр и 16-битный адрес"""
+        if not op2:
+            self.errors.append(f"Строка {line_num}: STORE требует двух операндов")
+            return None
+        
+        reg = self._register_codes.get(op1)
+        
+        if reg is None:
+            self.errors.append(f"Строка {line_num}: Неверный регистр '{op1.upper()}'")
+            return None
+        
+        # Парсинг адреса
+        addr = self._parse_int(op2)
+        
+        if not (0 <= addr <= 65535):
+            self.errors.append(f"Строка {line_num}: Адрес вне диапазона")
+            return None
+        
+        return _REG_ADDR16.pack(reg, addr)
+    
+    def _resolve_fixups(self):
+        """Подставляет адреса меток, на которые ссылались до их определения"""
+        for index, label, line_num in self._fixups:
+            addr = self.labels.get(label)
+            if addr is None:
+                self.errors.append(f"Строка {line_num}: Неизвестная метка '{label}'")
+                continue
+            
+            # То же правило, что и для уже известных меток в _h_addr
+            if addr > 255:
+                command = self._mnem_by_op[self._opcodes[index]]
+                self.errors.append(f"Строка {line_num}: Адрес вне диапазона [0-255] для {command}")
+                continue
+            
+            self._machine_code[self._addrs[index] + 1] = addr
+    
+    @property
+    def instructions(self) -> List[Dict]:
         """
-        Преобразует внутреннее представление в машинный код (список байтов).
+        Таблица инструкций в виде словарей (строится по запросу).
         
         Returns:
-            List[int]: Список байтов машинного кода
+            List[Dict]: mnemonic, opcode, operands, line, address
         """
-        machine_code = []
+        code = self._machine_code
+        ends = self._addrs[1:]
+        ends.append(len(code))
         
-        for instruction in self.instructions:
-            # Добавить опкод
-            machine_code.append(instruction['opcode'])
-            
-            # Добавить операнды
-            for operand in instruction['operands']:
-                machine_code.append(operand)
+        return [
+            {
+                'mnemonic': self._mnem_by_op[opcode],
+                'opcode': opcode,
+                'operands': list(code[addr + 1:end]),
+                'line': line_num,
+                'address': addr
+            }
+            for addr, end, opcode, line_num
+            in zip(self._addrs, ends, self._opcodes, self._lines)
+        ]
+    
+    # ========== НОВЫЕ МЕТОДЫ ДЛЯ ЭТАПА 2 ==========
+    
+    def get_machine_code(self) -> bytearray:
+        """
+        Возвращает машинный код, сформированный при ассемблировании.
         
-        return machine_code
+        Returns:
+            bytearray: Байты машинного кода
+        """
+        return self._machine_code
     
     def save_to_binary_file(self, filename: str) -> int:
         """
@@ -327,7 +419,7 @@ class Assembler:
         
         try:
             with open(filename, 'wb') as f:
-                f.write(bytes(machine_code))
+                f.write(machine_code)
             
             return len(machine_code)
         
@@ -342,8 +434,7 @@ class Assembler:
         Returns:
             str: Машинный код в формате '01 02 03 04 ...'
         """
-        machine_code = self.get_machine_code()
-        return ' '.join(f'{byte:02x}' for byte in machine_code)
+        return self.get_machine_code().hex(' ')
     
     def get_hex_output_0x(self) -> str:
         """
@@ -352,8 +443,26 @@ class Assembler:
         Returns:
             str: Машинный код в формате '0x01 0x02 0x03 ...'
         """
+        return ' '.join(_HEX0X[byte] for byte in self.get_machine_code())
+    
+    def write_hex(self, out=None, chunk: int = 4096):
+        """
+        Пишет машинный код в hex-формате в текстовый поток частями,
+        не собирая всю строку целиком.
+        
+        Args:
+            out: Текстовый поток (по умолчанию sys.stdout)
+            chunk: Количество байтов машинного кода в одной части
+        """
+        if out is None:
+            out = sys.stdout
+        
         machine_code = self.get_machine_code()
-        return ' '.join(f'0x{byte:02x}' for byte in machine_code)
+        for i in range(0, len(machine_code), chunk):
+            if i:
+                out.write(' ')
+            out.write(machine_code[i:i + chunk].hex(' '))
+        out.write('\n')
     
     def get_dec_output(self) -> str:
         """
@@ -362,8 +471,7 @@ class Assembler:
         Returns:
             str: Машинный код в формате '1 2 3 4 ...'
         """
-        machine_code = self.get_machine_code()
-        return ' '.join(str(byte) for byte in machine_code)
+        return ' '.join(_DEC[byte] for byte in self.get_machine_code())
     
     def get_statistics(self) -> Dict:
         """
@@ -375,7 +483,7 @@ class Assembler:
         machine_code = self.get_machine_code()
         
         return {
-            'num_instructions': len(self.instructions),
+            'num_instructions': len(self._opcodes),
             'num_bytes': len(machine_code),
             'num_labels': len(self.labels),
             'labels': self.labels
@@ -384,37 +492,41 @@ class Assembler:
     def print_test_output(self):
         """Выводит результат в формате теста из спецификации"""
         machine_code = self.get_machine_code()
+        hex_str = machine_code.hex(' ')
+        dec_str = ' '.join(_DEC[byte] for byte in machine_code)
         
         print("\n" + "="*60)
         print("РЕЗУЛЬТАТ АССЕМБЛИРОВАНИЯ (Этап 2)")
         print("="*60)
         
         # Статистика
-        stats = self.get_statistics()
         print(f"\nСтатистика:")
-        print(f"  Команд: {stats['num_instructions']}")
-        print(f"  Байтов: {stats['num_bytes']}")
-        print(f"  Меток: {stats['num_labels']}")
+        print(f"  Команд: {len(self._opcodes)}")
+        print(f"  Байтов: {len(machine_code)}")
+        print(f"  Меток: {len(self.labels)}")
         
         # Машинный код HEX
         print(f"\nМашинный код (hex):")
-        print(f"  {self.get_hex_output()}")
+        print(f"  {hex_str}")
         
         # Машинный код DEC
         print(f"\nМашинный код (dec):")
-        print(f"  {self.get_dec_output()}")
+        print(f"  {dec_str}")
         
         # Таблица инструкций
-        if self.instructions:
+        if self._opcodes:
             print(f"\nТаблица инструкций:")
             print(f"  {'Адр':<4} {'Команда':<8} {'Опкод':<6} {'Операнды':<20}")
             print(f"  {'-'*50}")
             
-            for instr in self.instructions:
-                addr = instr['address']
-                mnem = instr['mnemonic']
-                opcode = f"0x{instr['opcode']:02x}"
-                operands = ', '.join(f"0x{op:02x}" for op in instr['operands'])
+            # Операнды лежат в машинном коде до начала следующей инструкции
+            ends = self._addrs[1:]
+            ends.append(len(machine_code))
+            
+            for addr, end, op in zip(self._addrs, ends, self._opcodes):
+                mnem = self._mnem_by_op[op]
+                opcode = _HEX0X[op]
+                operands = ', '.join(_HEX0X[byte] for byte in machine_code[addr + 1:end])
                 
                 print(f"  {addr:<4} {mnem:<8} {opcode:<6} {operands:<20}")
         
@@ -486,9 +598,9 @@ def main():
     # Вывести машинный код
     if args.verbose:
         print(f"\nМашинный код (hex):")
-        print(assembler.get_hex_output())
     else:
-        print(f"\n{assembler.get_hex_output()}")
+        print()
+    assembler.write_hex()
     
     # Режим тестирования
     if args.test:
@@ -25,9 +25,25 @@
 """
 
 import argparse
+import re
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+from uvm_asm import tokenize
+
+# Числовой литерал в тех же формах, что принимает int(s, 0)
+_NUM_RE = re.compile(
+    r'\A[+-]?(?:0[xX](?P<hex>[0-9a-fA-F]+)|0[bB][01]+|0[oO][0-7]+'
+    r'|(?P<dec>[1-9][0-9]*|0+))\Z'
+)
+
+# Готовые значения самых частых литералов: '0'..'255' и однобайтовый hex
+_BYTE_LITERALS = {
+    fmt.format(i): i
+    for fmt in ('{}', '0x{:02x}', '0x{:02X}', '0X{:02X}')
+    for i in range(256)
+}
 
 
 class Assembler:
@@ -85,18 +101,37 @@ class Assembler:
             'D': 3,
         }
         
-        self.instructions: List[int] = []
+        # Написание команды в исходном тексте -> каноническое имя
+        self._command_names = {name: name for name in self.commands}
+        self._command_names.update(
+            (name.lower(), name) for name in self.commands
+        )
+        
+        self.code = bytearray()
         self.labels: Dict[str, int] = {}
         self.errors: List[str] = []
         self.warnings: List[str] = []
+        # Ссылки вперёд: (смещение в коде, имя метки, номер строки)
+        self._fixups: List[Tuple[int, str, int]] = []
+        # Первый операнд, который не может быть ни числом, ни меткой, и
+        # число предупреждений к этому месту
+        self._bad_operand: Optional[Tuple[int, str, int]] = None
+        self._warnings_before_bad = 0
     
     def is_valid_number(self, s: str) -> bool:
         """Проверка, является ли строка числом (поддерживает hex и decimal)"""
-        try:
-            int(s, 0)
-            return True
-        except ValueError:
-            return False
+        return _NUM_RE.match(s) is not None
+    
+    def parse_number(self, s: str) -> Optional[int]:
+        """Значение числового литерала или None, если строка не число"""
+        match = _NUM_RE.match(s)
+        if match is None:
+            return None
+        if match.lastgroup == 'dec':
+            return int(s)
+        if match.lastgroup == 'hex':
+            return int(s, 16)
+        return int(s, 0)
     
     def is_valid_identifier(self, s: str) -> bool:
         """Проверка, является ли строка корректным идентификатором"""
@@ -108,147 +143,167 @@ class Assembler:
         
         if operand in self.registers:
             return self.registers[operand]
-        elif self.is_valid_number(operand):
-            return int(operand, 0)
         else:
-            return None
+            return self.parse_number(operand)
     
-    def first_pass(self, lines: List[str]) -> bool:
+    def single_pass(self, source_code: str,
+                    registers: Optional[Dict[str, int]] = None) -> bool:
         """
-        Первый проход анализа:
+        Однопроходный анализ:
         - Поиск и регистрация меток
         - Проверка синтаксиса
-        - Подсчёт размера программы
+        - Генерация машинного кода
+        - Запоминание ссылок на ещё не определённые метки
+        
+        registers - имена, которые считаются регистрами (по умолчанию все)
         """
-        for line_num, line in enumerate(lines, 1):
-            # Удаляем комментарии
-            if ';' in line:
-                line = line.split(';')[0]
-            
-            line = line.strip()
-            if not line:
-                continue
-            
+        instr_count = 0
+        
+        # Локальные ссылки вместо поиска атрибутов на каждой строке
+        commands = self.commands
+        command_names = self._command_names
+        if registers is None:
+            registers = self.registers
+        labels = self.labels
+        parse_number = self.parse_number
+        emit = self.code.append
+        
+        for line_num, label, parts in tokenize(source_code):
             # Обработка метки
-            if line.endswith(':'):
-                label = line[:-1].strip()
+            if label is not None:
                 if not self.is_valid_identifier(label):
                     self.errors.append(
                         f"Строка {line_num}: Неверное имя метки '{label}'"
                     )
                     return False
-                if label in self.labels:
+                if label in labels:
                     self.errors.append(
                         f"Строка {line_num}: Метка '{label}' уже определена"
                     )
                     return False
-                self.labels[label] = len(self.instructions)
-                continue
-            
-            # Проверка команды
-            parts = line.split()
-            if not parts:
+                labels[label] = instr_count
                 continue
             
-            cmd = parts[0].upper()
-            if cmd not in self.commands:
-                self.errors.append(f"Строка {line_num}: Неизвестная команда '{cmd}'")
+            if parts is None:
+                self.errors.append(f"Строка {line_num}: Синтаксическая ошибка")
                 return False
             
-            # Подсчёт размера (простая оценка)
-            # Формат: OPCODE [операнд1] [операнд2]
-            self.instructions.append(0)  # Placeholder для размера
-        
-        return True
-    
-    def second_pass(self, lines: List[str]) -> bool:
-        """
-        Второй проход:
-        - Генерация машинного кода
-        - Разрешение адресов меток
-        - Финальная проверка ошибок
-        """
-        self.instructions = []
-        
-        for line_num, line in enumerate(lines, 1):
-            # Удаляем комментарии
-            if ';' in line:
-                line = line.split(';')[0]
-            
-            line = line.strip()
-            if not line or line.endswith(':'):
-                continue
-            
             # Разбор команды
-            parts = line.split()
-            cmd = parts[0].upper()
+            mnemonic = parts[0]
+            cmd = command_names.get(mnemonic) or mnemonic.upper()
+            opcode = commands.get(cmd)
             
-            if cmd not in self.commands:
-                continue
+            if opcode is None:
+                self.errors.append(f"Строка {line_num}: Неизвестная команда '{cmd}'")
+                return False
             
             # Добавляем opcode
-            self.instructions.append(self.commands[cmd])
+            emit(opcode)
+            instr_count += 1
             
             # Обработка операндов
-            operands = parts[1:] if len(parts) > 1 else []
-            
-            for operand in operands:
-                operand_clean = operand.rstrip(',').strip()
-                
-                if operand_clean in self.labels:
+            for operand_clean in parts[1:]:
+                if operand_clean in labels:
                     # Адрес метки
-                    addr = self.labels[operand_clean]
-                    self.instructions.append(addr)
-                elif operand_clean in self.registers:
+                    emit(self.label_address(operand_clean, line_num))
+                elif operand_clean in registers:
                     # Номер регистра
-                    self.instructions.append(self.registers[operand_clean])
-                elif self.is_valid_number(operand_clean):
+                    emit(registers[operand_clean])
+                elif (val := _BYTE_LITERALS.get(operand_clean)) is not None:
+                    # Однобайтовое число из таблицы
+                    emit(val)
+                elif (val := parse_number(operand_clean)) is not None:
                     # Числовое значение
-                    val = int(operand_clean, 0)
                     if val > 255:
                         self.warnings.append(
                             f"Строка {line_num}: Значение {val} больше 255, "
                             f"будет использовано {val & 0xFF}"
                         )
-                    self.instructions.append(val & 0xFF)
-                else:
-                    self.errors.append(
-                        f"Строка {line_num}: Неверный операнд '{operand_clean}'"
+                    emit(val & 0xFF)
+                elif self.is_valid_identifier(operand_clean):
+                    # Ссылка вперёд: адрес метки подставим в конце
+                    self._fixups.append(
+                        (len(self.code), operand_clean, line_num)
                     )
-                    return False
+                    self.code.append(0)
+                else:
+                    # Ошибку сообщим после прохода: неизвестная команда ниже
+                    # по тексту и неразрешённая метка выше важнее
+                    if self._bad_operand is None:
+                        self._bad_operand = (
+                            len(self.code), operand_clean, line_num
+                        )
+                        self._warnings_before_bad = len(self.warnings)
+                    emit(0)
         
-        return True
+        return self.resolve_fixups()
     
-    def assemble(self, source_code: str) -> bool:
-        """Главный метод ассемблирования"""
-        lines = source_code.split('\n')
+    def resolve_fixups(self) -> bool:
+        """Подстановка адресов меток, на которые ссылались до их определения"""
+        labels = self.labels
+        bad = self._bad_operand
+        if bad is not None:
+            # Предупреждения о строках после ошибки не нужны
+            del self.warnings[self._warnings_before_bad:]
         
-        # Первый проход
-        self.instructions = []
-        if not self.first_pass(lines):
-            return False
+        # Неразрешённая метка и неверный операнд: сообщаем о первом по тексту
+        for offset, label, line_num in self._fixups:
+            if bad is not None and offset > bad[0]:
+                break
+            if label not in labels:
+                bad = (offset, label, line_num)
+                break
+            self.code[offset] = self.label_address(label, line_num)
         
-        # Второй проход
-        self.instructions = []
-        if not self.second_pass(lines):
+        if bad is not None:
+            _, operand, line_num = bad
+            self.errors.append(f"Строка {line_num}: Неверный операнд '{operand}'")
             return False
         
         return True
     
+    def label_address(self, label: str, line_num: int) -> int:
+        """Адрес метки, приведённый к одному байту"""
+        addr = self.labels[label]
+        if addr > 255:
+            self.warnings.append(
+                f"Строка {line_num}: Адрес метки '{label}' ({addr}) больше 255, "
+                f"будет использовано {addr & 0xFF}"
+            )
+        return addr & 0xFF
+    
+    def assemble(self, source_code: str) -> bool:
+        """Главный метод ассемблирования"""
+        self.code = bytearray()
+        self._fixups = []
+        self._bad_operand = None
+        warning_count = len(self.warnings)
+        if not self.single_pass(source_code):
+            return False
+        
+        # Метка с именем регистра перекрывает регистр. Такие программы редки,
+        # поэтому собираем их заново, считая эти имена метками
+        if self.labels.keys().isdisjoint(self.registers):
+            return True
+        registers = {
+            name: reg for name, reg in self.registers.items()
+            if name not in self.labels
+        }
+        self.code = bytearray()
+        self._fixups = []
+        self.labels = {}
+        del self.warnings[warning_count:]
+        return self.single_pass(source_code, registers)
+    
     def get_hex_output(self) -> str:
         """Вывод машинного кода в шестнадцатеричном формате"""
-        if not self.instructions:
-            return "0x"
-        hex_bytes = ' '.join(f'{byte:02x}' for byte in self.instructions)
-        return f"0x{hex_bytes.replace(' ', '')}"
+        return '0x' + self.code.hex()
     
     def get_hex_pretty(self) -> str:
         """Красивый вывод машинного кода (по 16 байт в строке)"""
         result = []
-        for i in range(0, len(self.instructions), 16):
-            chunk = self.instructions[i:i+16]
-            hex_str = ' '.join(f'{byte:02x}' for byte in chunk)
-            result.append(hex_str)
+        for i in range(0, len(self.code), 16):
+            result.append(self.code[i:i+16].hex(' '))
         return '\n'.join(result)
     
     def get_detailed_output(self) -> str:
@@ -256,14 +311,14 @@ class Assembler:
         output = ["=" * 60]
         output.append("АССЕМБЛИРОВАННАЯ ПРОГРАММА")
         output.append("=" * 60)
-        output.append(f"Размер программы: {len(self.instructions)} байт")
-        output.append(f"Количество команд: ~{len(self.instructions) // 3}")
+        output.append(f"Размер программы: {len(self.code)} байт")
+        output.append(f"Количество команд: ~{len(self.code) // 3}")
         output.append("")
         output.append("Машинный код (hex):")
         output.append(self.get_hex_pretty())
         output.append("")
         output.append("Машинный код (dec):")
-        dec_str = ' '.join(str(b) for b in self.instructions)
+        dec_str = ' '.join(str(b) for b in self.code)
         for i in range(0, len(dec_str), 60):
             output.append(dec_str[i:i+60])
         
@@ -0,0 +1,214 @@
+"""
+Тесты ассемблеров УВМ (Этапы 1 и 2)
+
+Запуск:
+    python -m unittest discover -s tests
+"""
+
+import contextlib
+import importlib.util
+import io
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import assembler  # noqa: E402
+from uvm_asm import tokenize  # noqa: E402
+
+
+def _load_stage2():
+    """Загружает assembler-stage2.py (имя файла не является именем модуля)"""
+    spec = importlib.util.spec_from_file_location(
+        'assembler_stage2', ROOT / 'assembler-stage2.py'
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+assembler_stage2 = _load_stage2()
+
+
+def assemble_stage2(text):
+    """Ассемблирует текст Этапом 2; возвращает ассемблер и признак ошибки"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'program.asm'
+        path.write_text(text, encoding='utf-8')
+        asm = assembler_stage2.Assembler()
+        failed = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                asm.assemble(str(path))
+            except SystemExit:
+                failed = True
+    return asm, failed
+
+
+def syntax_error_lines(text):
+    """Номера строк, которые токенизатор счёл синтаксическими ошибками"""
+    return [line for line, label, parts in tokenize(text)
+            if label is None and parts is None]
+
+
+class TokenizerTest(unittest.TestCase):
+    """Разбор исходного текста общим токенизатором"""
+    
+    def test_invalid_last_line_without_newline(self):
+        self.assertEqual(syntax_error_lines('LOAD A, 5\nloop: HALT'), [2])
+    
+    def test_each_consecutive_invalid_line_reported(self):
+        text = 'a: HALT\nb: HALT\nc: HALT\nHALT\n'
+        self.assertEqual(syntax_error_lines(text), [1, 2, 3])
+    
+    def test_stage1_rejects_invalid_last_line(self):
+        asm = assembler.Assembler()
+        self.assertFalse(asm.assemble('LOAD A, 5\nloop: HALT'))
+        self.assertEqual(asm.errors, ['Строка 2: Синтаксическая ошибка'])
+    
+    def test_stage2_rejects_invalid_last_line(self):
+        asm, failed = assemble_stage2('LOAD A, 5\nloop: HALT')
+        self.assertTrue(failed)
+        self.assertEqual(asm.errors, ['Строка 2: Синтаксическая ошибка'])
+
+    def test_crlf_line_endings(self):
+        self.assertEqual(tokenize('LOAD A 1\r\nHALT\r\n'),
+                         [(1, None, ['LOAD', 'A', '1']), (2, None, ['HALT'])])
+    
+    def test_commas_separate_operands(self):
+        self.assertEqual(tokenize('LOAD A,5\nADD A ,B'),
+                         [(1, None, ['LOAD', 'A', '5']),
+                          (2, None, ['ADD', 'A', 'B'])])
+    
+    def test_comments_and_blank_lines_skipped(self):
+        self.assertEqual(tokenize('; заголовок\n\n  HALT ; стоп\n'),
+                         [(3, None, ['HALT'])])
+    
+    def test_label_forms(self):
+        self.assertEqual(tokenize('start:\nend :\n'),
+                         [(1, 'start', None), (2, 'end', None)])
+        self.assertEqual(syntax_error_lines(':\nx:y\nx: HALT\n'), [1, 2, 3])
+
+
+class Stage1Test(unittest.TestCase):
+    """Этап 1: однопроходная сборка со ссылками вперёд"""
+    
+    def assemble(self, text):
+        asm = assembler.Assembler()
+        ok = asm.assemble(text)
+        return asm, ok
+    
+    def test_forward_label_fixup(self):
+        asm, ok = self.assemble('JMP end\nHALT\nend:\nHALT\n')
+        self.assertTrue(ok)
+        self.assertEqual(bytes(asm.code), bytes([0x08, 2, 0x10, 0x10]))
+    
+    def test_unknown_label(self):
+        asm, ok = self.assemble('JMP nowhere\nHALT\n')
+        self.assertFalse(ok)
+        self.assertEqual(asm.errors, ["Строка 1: Неверный операнд 'nowhere'"])
+    
+    def test_unknown_command_reported_before_operand(self):
+        asm, ok = self.assemble('LOAD a 1\nFOO\n')
+        self.assertFalse(ok)
+        self.assertEqual(asm.errors, ["Строка 2: Неизвестная команда 'FOO'"])
+    
+    def test_first_bad_operand_in_source_order(self):
+        asm, ok = self.assemble('JMP nowhere\nLOAD A @\n')
+        self.assertFalse(ok)
+        self.assertEqual(asm.errors, ["Строка 1: Неверный операнд 'nowhere'"])
+        asm, ok = self.assemble('LOAD A @\nJMP nowhere\n')
+        self.assertFalse(ok)
+        self.assertEqual(asm.errors, ["Строка 1: Неверный операнд '@'"])
+    
+    def test_forward_label_shadows_register(self):
+        asm, ok = self.assemble('JMP B\nB:\nLOAD B 1\n')
+        self.assertTrue(ok)
+        self.assertEqual(bytes(asm.code), bytes([0x08, 1, 0x01, 1, 1]))
+    
+    def test_hex_literals(self):
+        for literal in ('0x1f', '0X1F', '0x1F', '31'):
+            asm, ok = self.assemble(f'LOAD A {literal}\n')
+            self.assertTrue(ok, literal)
+            self.assertEqual(bytes(asm.code), bytes([0x01, 0, 31]))
+    
+    def test_value_above_255_wraps_with_warning(self):
+        asm, ok = self.assemble('LOAD A 300\n')
+        self.assertTrue(ok)
+        self.assertEqual(bytes(asm.code), bytes([0x01, 0, 44]))
+        self.assertEqual(len(asm.warnings), 1)
+
+
+class Stage2Test(unittest.TestCase):
+    """Этап 2: коды команд, адреса меток и проверка диапазонов"""
+    
+    def test_label_is_byte_address(self):
+        asm, failed = assemble_stage2('STORE A 150\nCALL sub\nsub:\nJMP sub\n')
+        self.assertFalse(failed)
+        self.assertEqual(asm.labels, {'sub': 6})
+        self.assertEqual(bytes(asm.get_machine_code()),
+                         bytes([0x02, 0, 150, 0, 0x0C, 6, 0x08, 6]))
+    
+    def test_numeric_jump_out_of_range(self):
+        asm, failed = assemble_stage2('JZ 255\n')
+        self.assertFalse(failed)
+        asm, failed = assemble_stage2('JZ 268\n')
+        self.assertTrue(failed)
+        self.assertEqual(asm.errors,
+                         ['Строка 1: Адрес вне диапазона [0-255] для JZ'])
+    
+    def test_forward_label_out_of_range(self):
+        text = 'JMP far\n' + 'LOAD A 1\n' * 90 + 'far:\nHALT\n'
+        asm, failed = assemble_stage2(text)
+        self.assertTrue(failed)
+        self.assertEqual(asm.errors,
+                         ['Строка 1: Адрес вне диапазона [0-255] для JMP'])
+    
+    def test_backward_label_out_of_range(self):
+        text = 'LOAD A 1\n' * 90 + 'back:\nHALT\nJNZ back\n'
+        asm, failed = assemble_stage2(text)
+        self.assertTrue(failed)
+        self.assertEqual(asm.errors,
+                         ['Строка 93: Адрес вне диапазона [0-255] для JNZ'])
+    
+    def test_unknown_label(self):
+        asm, failed = assemble_stage2('JMP nowhere\n')
+        self.assertTrue(failed)
+        self.assertEqual(asm.errors, ["Строка 1: Неизвестная метка 'nowhere'"])
+    
+    def test_extra_operand_rejected(self):
+        asm, failed = assemble_stage2('LOAD A 1 2\n')
+        self.assertTrue(failed)
+        self.assertEqual(asm.errors, ['Строка 1: Синтаксическая ошибка'])
+    
+    def test_crlf_and_upper_hex(self):
+        asm, failed = assemble_stage2('LOAD A 0X1F\r\nHALT\r\n')
+        self.assertFalse(failed)
+        self.assertEqual(bytes(asm.get_machine_code()),
+                         bytes([0x01, 0, 0x1F, 0x10]))
+
+
+class GoldenTest(unittest.TestCase):
+    """Побайтовое сравнение сборки test-programs-fixed.asm с эталоном"""
+    
+    SOURCE = ROOT / 'test-programs-fixed.asm'
+    GOLDEN = Path(__file__).resolve().parent / 'golden'
+    
+    def test_stage1(self):
+        asm = assembler.Assembler()
+        self.assertTrue(asm.assemble(self.SOURCE.read_text(encoding='utf-8')))
+        expected = (self.GOLDEN / 'test-programs-fixed.stage1.bin').read_bytes()
+        self.assertEqual(bytes(asm.code), expected)
+    
+    def test_stage2(self):
+        asm, failed = assemble_stage2(self.SOURCE.read_text(encoding='utf-8'))
+        self.assertFalse(failed)
+        expected = (self.GOLDEN / 'test-programs-fixed.stage2.bin').read_bytes()
+        self.assertEqual(bytes(asm.get_machine_code()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
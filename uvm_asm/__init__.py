@@ -0,0 +1,7 @@
+"""
+Общие компоненты ассемблеров УВМ (Этапы 1 и 2)
+"""
+
+from .core import Token, tokenize
+
+__all__ = ['Token', 'tokenize']
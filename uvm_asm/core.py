@@ -0,0 +1,54 @@
+"""
+Разбор исходного текста ассемблера УВМ
+=======================================
+
+Общий токенизатор для обоих этапов: запятые заменяются пробелами во всём
+тексте сразу, затем в каждой строке отбрасывается комментарий, а значащие
+строки собираются в список кортежей.
+Генерация кода остаётся за самими ассемблерами.
+"""
+
+from typing import List, Optional, Tuple
+
+# Токен: (номер строки, имя метки, части команды).
+# Метка - (n, 'имя', None); команда - (n, None, ['LOAD', 'A', '5']);
+# строка, не подошедшая под синтаксис, - (n, None, None).
+Token = Tuple[int, Optional[str], Optional[List[str]]]
+
+
+def tokenize(text: str) -> List[Token]:
+    """
+    Разбивает исходный текст на токены, пропуская пустые строки и комментарии.
+    
+    Args:
+        text: Исходный текст программы
+    
+    Returns:
+        List[Token]: Метки, команды с операндами и синтаксические ошибки
+    """
+    tokens = []
+    append = tokens.append
+    
+    # Запятые между операндами равнозначны пробелам: убираются сразу во всём тексте
+    for line_num, line in enumerate(text.replace(',', ' ').split('\n'), 1):
+        # Убрать комментарий
+        line = line.partition(';')[0]
+        
+        parts = line.split()
+        if not parts:
+            continue
+        
+        if ':' not in line:
+            append((line_num, None, parts))
+            continue
+        
+        # Метка - единственное слово на строке: 'имя:' или 'имя :'
+        head = parts[0]
+        if len(parts) == 1 and head.find(':') == len(head) - 1 > 0:
+            append((line_num, head[:-1], None))
+        elif len(parts) == 2 and parts[1] == ':' and ':' not in head:
+            append((line_num, head, None))
+        else:
+            append((line_num, None, None))
+    
+    return tokens